@@ -79,8 +79,8 @@ class ChatPublisher:
             cur.execute("""
                 CREATE INDEX IF NOT EXISTS idx_chat_messages_sender_id ON chat_messages(sender_id);
                 CREATE INDEX IF NOT EXISTS idx_chat_messages_receiver_id ON chat_messages(receiver_id);
-                CREATE INDEX IF NOT EXISTS idx_message_status_message_id ON message_status(message_id);
                 CREATE INDEX IF NOT EXISTS idx_message_status_user_id ON message_status(user_id);
+                CREATE INDEX IF NOT EXISTS idx_message_status_message_id_ts ON message_status(message_id, timestamp DESC);
             """)
             
             conn.commit()
@@ -90,10 +90,11 @@ class ChatPublisher:
         """Callback for when the client connects to the MQTT broker."""
         if rc == 0:
             print("✅ Connected to MQTT Broker!")
-            # Subscribe to general chat topic and user-specific topic for status updates
-            client.subscribe(MQTT_TOPIC)
+            # Subscribe to user-specific topic for messages and status updates, and
+            # to the broadcast topic (peers no longer copy messages to MQTT_TOPIC)
             client.subscribe(f"{MQTT_TOPIC}/{CHAT_USER_ID}")
-            print(f"👂 Subscribed to topics: {MQTT_TOPIC}, {MQTT_TOPIC}/{CHAT_USER_ID}")
+            client.subscribe(f"{MQTT_TOPIC}/all")
+            print(f"👂 Subscribed to topics: {MQTT_TOPIC}/{CHAT_USER_ID}, {MQTT_TOPIC}/all")
         else:
             print(f"❌ Failed to connect to MQTT Broker, return code {rc}\n")
 
@@ -108,6 +109,8 @@ class ChatPublisher:
                 self.handle_chat_message(data)
             elif message_type == "status":
                 self.handle_status_update(data)
+            elif message_type == "read_batch":
+                self.handle_read_batch(data)
             elif message_type == "typing":
                 self.handle_typing_indicator(data)
                 
@@ -191,6 +194,15 @@ class ChatPublisher:
         emoji = status_emoji.get(status, "📊")
         print(f"{emoji} Message {message_id[:8]}... {status} by {user_id}")
 
+    def handle_read_batch(self, data):
+        """Handle a coalesced read receipt covering several messages."""
+        for message_id in data.get("message_ids") or []:
+            self.handle_status_update({
+                "message_id": message_id,
+                "status": data.get("status", "read"),
+                "user_id": data.get("user_id")
+            })
+
     def handle_typing_indicator(self, data):
         """Handle typing indicators."""
         sender_id = data.get("sender_id")
@@ -233,13 +245,10 @@ class ChatPublisher:
             "timestamp": timestamp
         }
         
-        # Publish to receiver's topic
+        # Publish to receiver's topic only; a logger can subscribe to f"{MQTT_TOPIC}/#"
         topic = f"{MQTT_TOPIC}/{receiver_id}"
         self.client.publish(topic, json.dumps(message_data))
         
-        # Also publish to general topic for logging
-        self.client.publish(MQTT_TOPIC, json.dumps(message_data))
-        
         # Store in database
         with self.db_conn.cursor() as cur:
             cur.execute("""
@@ -1,12 +1,26 @@
+import hashlib
+import io
+import logging
+import logging.handlers
 import os
+import queue
+import sched
+import select
+import sys
 import time
-import json
 import uuid
 import threading
-from datetime import datetime
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+import msgspec
+import orjson
 import paho.mqtt.client as mqtt
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 # --- Configuration from Environment Variables ---
 MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
@@ -20,29 +34,260 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "uX3_YnF3y485NziMN6xW")
 CHAT_USER_ID = os.getenv("CHAT_USER_ID", "david")
 CHAT_USER_NAME = os.getenv("CHAT_USER_NAME", "David")
 
+# Per-user topics are TOPIC_PREFIX + user_id
+TOPIC_PREFIX = f"{MQTT_TOPIC}/"
+
+# Bound lookup for status display, built once instead of per update
+_STATUS_EMOJI = {
+    "sent": "📤",
+    "received_by_server": "✅",
+    "delivered": "📥",
+    "read": "👁️"
+}.get
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+logger = logging.getLogger("chat.subscriber")
+
+# Database pool and message worker sizing
+DB_POOL_MIN_CONN = 2
+DB_POOL_MAX_CONN = 8
+MESSAGE_WORKERS = os.cpu_count() or 4
+INBOX_SIZE = 65536  # received payloads waiting across all workers before new ones are dropped
+
+# Outgoing timestamps are aware UTC datetimes, serialized with a trailing "Z"
+JSON_OPTIONS = orjson.OPT_UTC_Z
+
+# Outgoing payload templates. Constant fields are JSON-encoded once here (with
+# "%" escaped); each %b slot takes an already JSON-encoded value.
+_USER_ID_JSON = orjson.dumps(CHAT_USER_ID).replace(b"%", b"%%")
+_USER_NAME_JSON = orjson.dumps(CHAT_USER_NAME).replace(b"%", b"%%")
+
+MESSAGE_TEMPLATE = (
+    b'{"type":"message","message_id":"%b","sender_id":' + _USER_ID_JSON
+    + b',"sender_name":' + _USER_NAME_JSON
+    + b',"receiver_id":%b,"content":%b,"message_type":%b,"timestamp":%b}'
+)
+READ_RECEIPT_TEMPLATE = (
+    b'{"type":"status","message_id":%b,"status":"read","user_id":' + _USER_ID_JSON
+    + b',"timestamp":%b}'
+)
+READ_BATCH_TEMPLATE = (
+    b'{"type":"read_batch","message_ids":%b,"status":"read","user_id":' + _USER_ID_JSON
+    + b',"timestamp":%b}'
+)
+TYPING_TEMPLATE = (
+    b'{"type":"typing","sender_id":' + _USER_ID_JSON
+    + b',"sender_name":' + _USER_NAME_JSON
+    + b',"receiver_id":%b,"is_typing":%b,"timestamp":%b}'
+)
+
+# Message ids come from random bytes drawn UUID_POOL_SIZE ids at a time,
+# so os.urandom runs once per pool instead of once per message
+UUID_POOL_SIZE = 4096
+_uuid_pool = deque()
+
+def new_message_id():
+    """Returns a new random (version 4) UUID string."""
+    while True:
+        try:
+            return str(uuid.UUID(bytes=_uuid_pool.popleft(), version=4))
+        except IndexError:
+            entropy = os.urandom(16 * UUID_POOL_SIZE)
+            _uuid_pool.extend(entropy[i:i + 16] for i in range(0, len(entropy), 16))
+
+def json_timestamp():
+    """Returns the current UTC time as an encoded JSON string."""
+    return orjson.dumps(datetime.now(timezone.utc), option=JSON_OPTIONS)
+
+# Main-thread event loop over stdin and the MQTT socket (seconds)
+EVENT_LOOP_TIMEOUT = 1.0
+STDIN_READ_SIZE = 65536  # bytes taken from the stdin descriptor per read
+MQTT_RECONNECT_DELAY = 5.0
+
+# Read receipts are coalesced per sender and sent on this interval (seconds)
+READ_RECEIPT_INTERVAL = 2.0
+
+# Minimum seconds between "is typing" indicators accepted from one sender
+TYPING_MIN_INTERVAL = 0.5
+
+# Recently received message ids remembered to drop broker redeliveries
+SEEN_MESSAGE_IDS = 50000
+
+# Received messages kept in memory; older ones remain available from the database
+MESSAGE_HISTORY_SIZE = 500
+
+# Write-behind batching for incoming rows
+FLUSH_INTERVAL = 0.05      # seconds the flusher sleeps between idle checks
+FLUSH_BATCH_SIZE = 500     # pending rows that wake the flusher early
+FLUSH_BUFFER_LIMIT = 10000 # producers block once this many rows are pending
+COPY_THRESHOLD = 1024      # batches this large go through COPY instead of INSERT
+DB_RECONNECT_DELAY = 5.0   # seconds the flusher waits between reconnect attempts
+
+INSERT_MESSAGES_SQL = """
+    INSERT INTO chat_messages (message_id, sender_id, sender_name, receiver_id, content, message_type)
+    VALUES %s
+    ON CONFLICT (message_id) DO NOTHING
+"""
+INSERT_STATUS_SQL = """
+    INSERT INTO message_status (message_id, status, user_id)
+    VALUES %s
+"""
+MERGE_STAGE_SQL = """
+    INSERT INTO chat_messages (message_id, sender_id, sender_name, receiver_id, content, message_type)
+    SELECT message_id, sender_id, sender_name, receiver_id, content, message_type
+    FROM chat_messages_stage
+    ON CONFLICT (message_id) DO NOTHING
+"""
+
+# Single-row inserts for the row-by-row fallback after a failed batch
+INSERT_MESSAGE_ROW_SQL = """
+    INSERT INTO chat_messages (message_id, sender_id, sender_name, receiver_id, content, message_type)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (message_id) DO NOTHING
+"""
+INSERT_STATUS_ROW_SQL = """
+    INSERT INTO message_status (message_id, status, user_id)
+    VALUES (%s, %s, %s)
+"""
+
+class ChatEvent(msgspec.Struct):
+    """Fields of every inbound payload type; unknown keys such as timestamp are skipped."""
+    type: str = "message"
+    message_id: Optional[str] = None
+    sender_id: Optional[str] = None
+    sender_name: Optional[str] = None
+    receiver_id: Optional[str] = None
+    content: Optional[str] = None
+    message_type: Optional[str] = "text"
+    status: Optional[str] = None
+    user_id: Optional[str] = None
+    is_typing: bool = False
+    message_ids: List[str] = []
+
+# Decodes payloads straight into ChatEvent fields, with no intermediate dict
+decode_event = msgspec.json.Decoder(ChatEvent).decode
+
+def copy_field(value):
+    """Encodes a value for COPY ... WITH (FORMAT text)."""
+    if value is None:
+        return "\\N"
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+def setup_logging():
+    """Routes log records through a queue so callers never block writing to stdout."""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+class Inbox:
+    """Bounded event queue for handing messages from the network thread to a worker.
+
+    Built on queue.SimpleQueue, which is implemented in C: put() never blocks
+    and wakes at most one waiting get(), so idle workers sleep until there
+    is a payload for them instead of polling.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = queue.SimpleQueue()
+
+    def put_nowait(self, item):
+        """Append an item, raising queue.Full when at capacity."""
+        if self._items.qsize() >= self.capacity:
+            raise queue.Full
+        self._items.put(item)
+
+    def put(self, item):
+        """Append an item regardless of capacity (used for shutdown sentinels)."""
+        self._items.put(item)
+
+    def get(self):
+        """Remove and return the oldest item, sleeping while the inbox is empty."""
+        return self._items.get()
+
 class ChatSubscriber:
     def __init__(self):
         self.client = None
-        self.db_conn = None
-        self.message_history = []
+        self.pool = None
+        # Payloads handed from the MQTT network thread to the workers
+        # One inbox per worker; each sender always maps to the same one
+        self._inboxes = [Inbox(INBOX_SIZE // MESSAGE_WORKERS) for _ in range(MESSAGE_WORKERS)]
+        self._workers = []
+        self.message_history = deque(maxlen=MESSAGE_HISTORY_SIZE)
         self.running = True
+        # Rows waiting for the background flusher
+        self._msg_buf = deque()
+        self._status_buf = deque()
+        self._flush_cond = threading.Condition()
+        self._flush_thread = None
+        # Set only by stop_flusher(), after the workers have drained the inbox
+        self._flush_stop = threading.Event()
+        # Flusher-owned connections and cursors, set up in flush_loop
+        self._msg_conn = self._msg_cur = None
+        self._status_conn = self._status_cur = None
+        # Single thread that runs all deferred work (read receipts, typing timeouts)
+        self._sched_wakeup = threading.Event()
+        self._sched = sched.scheduler(time.monotonic, self.scheduler_sleep)
+        self._sched_thread = None
+        self._next_reconnect = 0.0
+        # Helper thread running a blocking reconnect(), if one is in progress
+        self._reconnect_thread = None
+        # Bytes read from stdin that don't yet end in a newline
+        self._stdin_buf = b""
+        # Last accepted "is typing" time per sender (monotonic seconds)
+        self._typing_seen = {}
+        # Insertion-ordered window of recently received message ids
+        self._seen_ids = OrderedDict()
+        self._seen_lock = threading.Lock()
+        # Message ids awaiting a read receipt, keyed by sender
+        self._pending_receipts = {}
+        self._receipts_lock = threading.Lock()
         
-    def get_db_connection(self):
-        """Establishes a connection to the PostgreSQL database with retries."""
-        conn = None
-        while conn is None:
+    def get_db_pool(self):
+        """Establishes a pool of connections to the PostgreSQL database with retries."""
+        pool = None
+        while pool is None:
             try:
-                conn = psycopg2.connect(
+                pool = ThreadedConnectionPool(
+                    minconn=DB_POOL_MIN_CONN,
+                    maxconn=DB_POOL_MAX_CONN,
                     host=POSTGRES_HOST,
                     dbname=POSTGRES_DB,
                     user=POSTGRES_USER,
                     password=POSTGRES_PASSWORD
                 )
-                print("✅ Database connection successful!")
+                logger.info("✅ Database connection successful!")
             except psycopg2.OperationalError as e:
-                print(f"❌ Database connection failed: {e}. Retrying in 5 seconds...")
+                logger.error("❌ Database connection failed: %s. Retrying in 5 seconds...", e)
                 time.sleep(5)
-        return conn
+        return pool
+
+    @contextmanager
+    def db_cursor(self):
+        """Borrows a pooled connection for one transaction and yields a cursor."""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
 
     def setup_database(self, conn):
         """Creates the necessary tables for chat functionality."""
@@ -78,80 +323,121 @@ class ChatSubscriber:
             cur.execute("""
                 CREATE INDEX IF NOT EXISTS idx_chat_messages_sender_id ON chat_messages(sender_id);
                 CREATE INDEX IF NOT EXISTS idx_chat_messages_receiver_id ON chat_messages(receiver_id);
-                CREATE INDEX IF NOT EXISTS idx_message_status_message_id ON message_status(message_id);
                 CREATE INDEX IF NOT EXISTS idx_message_status_user_id ON message_status(user_id);
+                CREATE INDEX IF NOT EXISTS idx_message_status_message_id_ts ON message_status(message_id, timestamp DESC);
             """)
             
+            # The (message_id, timestamp) index also serves message_id lookups, so
+            # the older single-column index is only extra work on every status insert
+            cur.execute("DROP INDEX IF EXISTS idx_message_status_message_id;")
+            
+            # Partial index matching get_message_history's filter for this user, so the
+            # newest rows come straight off the index instead of a BitmapOr plus sort.
+            # Named by a hash of the user id, since PostgreSQL truncates names past
+            # 63 bytes and long ids sharing a prefix would collide.
+            user_hash = hashlib.sha1(CHAT_USER_ID.encode()).hexdigest()[:16]
+            cur.execute(sql.SQL("""
+                CREATE INDEX IF NOT EXISTS {index} ON chat_messages(created_at DESC)
+                WHERE sender_id = {user_id} OR receiver_id = {user_id};
+            """).format(
+                index=sql.Identifier(f"idx_chat_messages_participant_{user_hash}"),
+                user_id=sql.Literal(CHAT_USER_ID)
+            ))
+            
             conn.commit()
-            print("📖 Chat database tables are ready.")
+            logger.info("📖 Chat database tables are ready.")
 
     def on_connect(self, client, userdata, flags, rc):
         """Callback for when the client connects to the MQTT broker."""
         if rc == 0:
-            print("✅ Connected to MQTT Broker!")
-            # Subscribe to general chat topic and user-specific topic
-            client.subscribe(MQTT_TOPIC)
-            client.subscribe(f"{MQTT_TOPIC}/{CHAT_USER_ID}")
-            print(f"👂 Subscribed to topics: {MQTT_TOPIC}, {MQTT_TOPIC}/{CHAT_USER_ID}")
+            logger.info("✅ Connected to MQTT Broker!")
+            # Subscribe only to this user's topic and the broadcast topic; the
+            # broker filters out traffic addressed to other users for free
+            topics = [TOPIC_PREFIX + CHAT_USER_ID, TOPIC_PREFIX + "all"]
+            client.subscribe([(topic, 0) for topic in topics])
+            logger.info("👂 Subscribed to topics: %s", ", ".join(topics))
         else:
-            print(f"❌ Failed to connect to MQTT Broker, return code {rc}\n")
+            logger.error("❌ Failed to connect to MQTT Broker, return code %s", rc)
 
     def on_message(self, client, userdata, msg):
         """Callback for when a message is received from the MQTT broker."""
+        # Only decode and enqueue here so the network thread can read the next packet
         try:
-            payload = msg.payload.decode()
-            print(f"📩 Received message on topic '{msg.topic}': {payload}")
-            
-            data = json.loads(payload)
-            message_type = data.get("type", "message")
+            logger.debug("📩 Received message: %r", msg.payload)
+            data = decode_event(msg.payload)
+        except msgspec.DecodeError as error:
+            logger.warning("⚠️ Could not decode JSON from payload: %r (%s)", msg.payload, error)
+            return
+        
+        # Route by sender so one worker sees all of a sender's events, in order
+        sender = data.sender_id or data.user_id
+        inbox = self._inboxes[hash(sender) % len(self._inboxes)]
+        try:
+            inbox.put_nowait(data)
+        except queue.Full:
+            logger.warning("⚠️ Inbox full, dropping message on topic '%s'", msg.topic)
+
+    def worker_loop(self, inbox):
+        """Take events from one inbox and dispatch them until a None sentinel arrives."""
+        while True:
+            data = inbox.get()
+            if data is None:
+                return
+            self.dispatch(data)
+
+    def dispatch(self, data):
+        """Dispatch a decoded event by type."""
+        try:
+            message_type = data.type
             
             if message_type == "message":
                 self.handle_chat_message(data)
             elif message_type == "status":
                 self.handle_status_update(data)
+            elif message_type == "read_batch":
+                self.handle_read_batch(data)
             elif message_type == "typing":
-                self.handle_typing_indicator(data)
+                if not self.typing_rate_limited(data):
+                    self.handle_typing_indicator(data)
                 
-        except json.JSONDecodeError:
-            print(f"⚠️ Could not decode JSON from payload: {msg.payload.decode()}")
         except Exception as error:
-            print(f"🔥 Error processing message: {error}")
+            logger.error("🔥 Error processing message: %s", error)
 
     def handle_chat_message(self, data):
         """Handle incoming chat messages."""
-        message_id = data.get("message_id")
-        sender_id = data.get("sender_id")
-        sender_name = data.get("sender_name")
-        receiver_id = data.get("receiver_id")
-        content = data.get("content")
-        message_type = data.get("message_type", "text")
+        message_id = data.message_id
+        sender_id = data.sender_id
+        sender_name = data.sender_name
+        receiver_id = data.receiver_id
+        content = data.content
+        message_type = data.message_type
         
-        # Only process messages intended for this user or broadcast messages
+        # Topic subscriptions already filter by receiver; keep this as a safety net
         if receiver_id != CHAT_USER_ID and receiver_id != "all":
             return
+        
+        # Redelivered message: already stored, displayed and receipted
+        if self.mark_seen(message_id):
+            return
             
-        # Store message in database
-        with self.db_conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO chat_messages (message_id, sender_id, sender_name, receiver_id, content, message_type)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (message_id) DO NOTHING
-            """, [message_id, sender_id, sender_name, receiver_id, content, message_type])
-            
-            # Add status: received by server
-            cur.execute("""
-                INSERT INTO message_status (message_id, status, user_id)
-                VALUES (%s, %s, %s)
-            """, [message_id, "received_by_server", CHAT_USER_ID])
-            
-            self.db_conn.commit()
+        # Queue message and "received by server" status for the flusher.
+        # If it can't take them, forget the id so a redelivery is handled in full.
+        if not self.buffer_rows(
+            msg_row=(message_id, sender_id, sender_name, receiver_id, content, message_type),
+            status_row=(message_id, "received_by_server", CHAT_USER_ID),
+        ):
+            self.forget_seen(message_id)
+            return
         
         # Display message
         timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"\n💬 [{timestamp}] {sender_name}: {content}")
+        logger.info("\n💬 [%s] %s: %s", timestamp, sender_name, content)
         
-        # Send read receipt after a short delay (simulating user reading)
-        threading.Timer(2.0, self.send_read_receipt, args=[message_id, sender_id]).start()
+        # Queue a read receipt; the periodic flush sends one per sender (simulating user reading).
+        # Senders that can't be addressed as a topic get no receipt.
+        if sender_id and "+" not in sender_id and "#" not in sender_id:
+            with self._receipts_lock:
+                self._pending_receipts.setdefault(sender_id, []).append(message_id)
         
         # Add to local history
         self.message_history.append({
@@ -163,118 +449,417 @@ class ChatSubscriber:
             "status": "received"
         })
 
+    def mark_seen(self, message_id):
+        """Record a received message id; returns True if it was seen recently."""
+        with self._seen_lock:
+            if message_id in self._seen_ids:
+                return True
+            self._seen_ids[message_id] = None
+            if len(self._seen_ids) > SEEN_MESSAGE_IDS:
+                self._seen_ids.popitem(last=False)
+            return False
+
+    def forget_seen(self, message_id):
+        """Drop a message id recorded by mark_seen() whose message wasn't stored."""
+        with self._seen_lock:
+            self._seen_ids.pop(message_id, None)
+
     def handle_status_update(self, data):
         """Handle message status updates."""
-        message_id = data.get("message_id")
-        status = data.get("status")
-        user_id = data.get("user_id")
+        message_id = data.message_id
+        status = data.status
+        user_id = data.user_id
         
-        # Update status in database
-        with self.db_conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO message_status (message_id, status, user_id)
-                VALUES (%s, %s, %s)
-            """, [message_id, status, user_id])
-            self.db_conn.commit()
+        # Queue status row for the flusher
+        self.buffer_rows(status_row=(message_id, status, user_id))
         
         # Display status update
-        status_emoji = {
-            "sent": "📤",
-            "received_by_server": "✅",
-            "delivered": "📥",
-            "read": "👁️"
-        }
-        emoji = status_emoji.get(status, "📊")
-        print(f"{emoji} Message {message_id[:8]}... {status} by {user_id}")
+        emoji = _STATUS_EMOJI(status, "📊")
+        logger.info("%s Message %.8s... %s by %s", emoji, message_id, status, user_id)
+
+    def handle_read_batch(self, data):
+        """Handle a coalesced read receipt covering several messages."""
+        message_ids = data.message_ids
+        status = data.status or "read"
+        user_id = data.user_id
+        
+        for message_id in message_ids:
+            self.buffer_rows(status_row=(message_id, status, user_id))
+        
+        logger.info("👁️ %d messages %s by %s", len(message_ids), status, user_id)
+
+    def typing_rate_limited(self, data):
+        """Returns True for a repeated "is typing" event that should be shed.
+
+        "Stopped typing" always passes so the indicator never sticks. Each
+        sender is handled by a single worker, so its entry is never raced.
+        """
+        if not data.is_typing:
+            return False
+        now = time.monotonic()
+        if now - self._typing_seen.get(data.sender_id, float("-inf")) < TYPING_MIN_INTERVAL:
+            return True
+        self._typing_seen[data.sender_id] = now
+        return False
 
     def handle_typing_indicator(self, data):
         """Handle typing indicators."""
-        sender_id = data.get("sender_id")
-        sender_name = data.get("sender_name")
-        is_typing = data.get("is_typing", False)
+        sender_id = data.sender_id
+        sender_name = data.sender_name
+        is_typing = data.is_typing
         
         if is_typing:
-            print(f"✍️ {sender_name} is typing...")
+            logger.info("✍️ %s is typing...", sender_name)
+        else:
+            logger.info("   %s stopped typing", sender_name)
+
+    def flusher_alive(self):
+        """Returns True while the flusher thread is running."""
+        return self._flush_thread is not None and self._flush_thread.is_alive()
+
+    def buffer_rows(self, msg_row=None, status_row=None, block=True):
+        """Queue rows for the background flusher, blocking while the buffer is full.
+
+        Returns False, without queueing, if the flusher is not running or if
+        the buffer is full and `block` is False.
+        """
+        with self._flush_cond:
+            while True:
+                if not self.flusher_alive():
+                    logger.error("🔥 Flusher is not running, dropping rows for message %s",
+                                 (msg_row or status_row)[0])
+                    return False
+                if len(self._msg_buf) + len(self._status_buf) < FLUSH_BUFFER_LIMIT:
+                    break
+                if not block:
+                    logger.error("🔥 Write buffer full, dropping rows for message %s",
+                                 (msg_row or status_row)[0])
+                    return False
+                # Timed wait so a flusher that dies can't leave producers parked forever
+                self._flush_cond.wait(FLUSH_INTERVAL)
+            was_empty = not (self._msg_buf or self._status_buf)
+            if msg_row is not None:
+                self._msg_buf.append(msg_row)
+            if status_row is not None:
+                self._status_buf.append(status_row)
+            
+            # Wake the flusher as soon as work arrives, or when a full batch is ready
+            if was_empty or len(self._msg_buf) + len(self._status_buf) >= FLUSH_BATCH_SIZE:
+                self._flush_cond.notify_all()
+            return True
+
+    def requeue_rows(self, msg_rows, status_rows):
+        """Put an unwritten batch back at the front of the buffers."""
+        with self._flush_cond:
+            self._msg_buf.extendleft(reversed(msg_rows))
+            self._status_buf.extendleft(reversed(status_rows))
+
+    def open_flush_connections(self):
+        """Check out and set up the flusher's connections, retrying while the database is down.
+
+        Returns False if the flusher is stopped before the database comes back.
+        """
+        while True:
+            try:
+                # Message and status rows use separate connections so only status
+                # commits skip waiting for the WAL flush
+                self._msg_conn = self.pool.getconn()
+                self._status_conn = self.pool.getconn()
+                self.setup_stage_table(self._msg_conn)
+                with self._status_conn.cursor() as cur:
+                    # Status rows are ephemeral; losing the last few on a crash is acceptable
+                    cur.execute("SET synchronous_commit = off")
+                self._status_conn.commit()
+                
+                # One cursor per connection until it breaks; both survive rollbacks
+                self._msg_cur = self._msg_conn.cursor()
+                self._status_cur = self._status_conn.cursor()
+                return True
+            except psycopg2.Error as error:
+                logger.error("❌ Flusher could not reach the database: %s. Retrying in %s seconds...",
+                             error, DB_RECONNECT_DELAY)
+                self.release_flush_connections(broken=True)
+            
+            if self._flush_stop.wait(DB_RECONNECT_DELAY):
+                with self._flush_cond:
+                    pending = len(self._msg_buf) + len(self._status_buf)
+                if pending:
+                    logger.error("🔥 Database unavailable at shutdown, dropping %d rows", pending)
+                return False
+
+    def release_flush_connections(self, broken=False):
+        """Return the flusher's connections to the pool, closing them if broken."""
+        close_status = broken
+        if not broken and self._status_cur is not None:
+            # Don't hand an asynchronous-commit session back to other pool users
+            try:
+                self._status_cur.execute("RESET synchronous_commit")
+                self._status_conn.commit()
+            except psycopg2.Error as error:
+                logger.warning("⚠️ Could not reset the status connection, closing it: %s", error)
+                close_status = True
+        for conn, close in ((self._msg_conn, broken), (self._status_conn, close_status)):
+            if conn is not None:
+                self.pool.putconn(conn, close=close or bool(conn.closed))
+        self._msg_conn = self._msg_cur = None
+        self._status_conn = self._status_cur = None
+
+    def flush_loop(self):
+        """Drain buffered rows into the database until stop_flusher() is called."""
+        if not self.open_flush_connections():
+            return
+        try:
+            while True:
+                with self._flush_cond:
+                    while not (self._msg_buf or self._status_buf):
+                        if self._flush_stop.is_set():
+                            return
+                        self._flush_cond.wait(FLUSH_INTERVAL)
+                    
+                    msg_rows = list(self._msg_buf)
+                    status_rows = list(self._status_buf)
+                    self._msg_buf.clear()
+                    self._status_buf.clear()
+                    # Release producers blocked on a full buffer
+                    self._flush_cond.notify_all()
+                
+                try:
+                    self.flush_rows(msg_rows, status_rows)
+                except psycopg2.Error as error:
+                    # Row-level errors are handled in flush_batch, so this is the
+                    # connection itself. Message rows are idempotent; a status batch
+                    # cut off mid-fallback may repeat a few rows.
+                    logger.error("🔥 Flusher lost its database connection: %s. Reconnecting...", error)
+                    self.requeue_rows(msg_rows, status_rows)
+                    self.release_flush_connections(broken=True)
+                    if not self.open_flush_connections():
+                        return
+                except Exception as error:
+                    logger.error("🔥 Dropping %d rows after flusher error: %s",
+                                 len(msg_rows) + len(status_rows), error)
+        finally:
+            self.release_flush_connections()
+
+    def flush_rows(self, msg_rows, status_rows):
+        """Write a batch of message rows, then its status rows."""
+        # Messages commit first so status rows satisfy their foreign key
+        self.flush_batch(self._msg_conn, self._msg_cur, msg_rows,
+                         self.write_messages, INSERT_MESSAGE_ROW_SQL)
+        self.flush_batch(self._status_conn, self._status_cur, status_rows,
+                         self.write_statuses, INSERT_STATUS_ROW_SQL)
+
+    def flush_batch(self, conn, cur, rows, write, fallback_query):
+        """Write rows in one transaction, retrying them one by one if it fails."""
+        if not rows:
+            return
+        try:
+            write(cur, rows)
+            conn.commit()
+        except psycopg2.Error as error:
+            self.rollback_or_raise(conn, error)
+            logger.warning("⚠️ Batch insert failed, retrying rows one by one: %s", error)
+            self.flush_rows_individually(conn, cur, fallback_query, rows)
+
+    def write_messages(self, cur, rows):
+        """Insert message rows, skipping ones that already exist."""
+        if len(rows) >= COPY_THRESHOLD:
+            # COPY can't skip duplicates, so stage the burst and merge it
+            self.copy_rows(
+                cur,
+                "chat_messages_stage (message_id, sender_id, sender_name, receiver_id, content, message_type)",
+                rows,
+            )
+            cur.execute(MERGE_STAGE_SQL)
         else:
-            print(f"   {sender_name} stopped typing")
+            # One page, so the whole batch goes to the server as a single statement
+            execute_values(cur, INSERT_MESSAGES_SQL, rows, page_size=len(rows))
+
+    def write_statuses(self, cur, rows):
+        """Insert status rows."""
+        if len(rows) >= COPY_THRESHOLD:
+            self.copy_rows(cur, "message_status (message_id, status, user_id)", rows)
+        else:
+            execute_values(cur, INSERT_STATUS_SQL, rows, page_size=len(rows))
+
+    def setup_stage_table(self, conn):
+        """Creates the session-local staging table used for COPY bursts."""
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS chat_messages_stage (
+                    message_id VARCHAR(255) NOT NULL,
+                    sender_id VARCHAR(100) NOT NULL,
+                    sender_name VARCHAR(100) NOT NULL,
+                    receiver_id VARCHAR(100) NOT NULL,
+                    content TEXT NOT NULL,
+                    message_type VARCHAR(50) DEFAULT 'text'
+                ) ON COMMIT DELETE ROWS
+            """)
+        conn.commit()
+
+    def copy_rows(self, cur, target, rows):
+        """Streams rows into `target` (a table and column list) with COPY FROM STDIN."""
+        buf = io.StringIO()
+        for row in rows:
+            buf.write("\t".join(map(copy_field, row)))
+            buf.write("\n")
+        buf.seek(0)
+        cur.copy_expert(f"COPY {target} FROM STDIN WITH (FORMAT text)", buf)
+
+    def flush_rows_individually(self, conn, cur, query, rows):
+        """Fallback for a failed batch so one bad row does not drop the rest."""
+        for row in rows:
+            try:
+                cur.execute(query, row)
+                conn.commit()
+            except psycopg2.Error as error:
+                self.rollback_or_raise(conn, error)
+                logger.error("🔥 Dropping row for message %s: %s", row[0], error)
+
+    def rollback_or_raise(self, conn, error):
+        """Roll back after a failed write, re-raising `error` if the connection is gone.
+
+        On a dropped connection rollback() fails with "connection already
+        closed", which would hide the error that explains the disconnect.
+        """
+        if not conn.closed:
+            try:
+                conn.rollback()
+                return
+            except psycopg2.Error:
+                pass
+        raise error
+
+    def schedule(self, delay, action, args=()):
+        """Run `action(*args)` after `delay` seconds on the scheduler thread."""
+        self._sched.enter(delay, 1, action, args)
+        # Interrupt the scheduler's sleep in case this event is due earlier
+        self._sched_wakeup.set()
+
+    def scheduler_sleep(self, delay):
+        """Delay function for the scheduler that wakes early when new events arrive."""
+        self._sched_wakeup.wait(delay)
+        self._sched_wakeup.clear()
+
+    def scheduler_loop(self):
+        """Run scheduled events until shutdown."""
+        while self.running:
+            try:
+                self._sched.run()
+            except Exception as error:
+                logger.error("🔥 Error in scheduled task: %s", error)
+                continue
+            # Queue is empty; sleep until something is scheduled
+            self.scheduler_sleep(1.0)
+
+    def stop_workers(self):
+        """Let the workers finish queued payloads, then stop them."""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def stop_flusher(self):
+        """Stop the flusher thread after it writes any remaining rows."""
+        self._flush_stop.set()
+        with self._flush_cond:
+            self._flush_cond.notify_all()
+        if self._flush_thread:
+            self._flush_thread.join()
 
     def send_read_receipt(self, message_id, sender_id):
         """Send read receipt for a message."""
-        status_data = {
-            "type": "status",
-            "message_id": message_id,
-            "status": "read",
-            "user_id": CHAT_USER_ID,
-            "timestamp": datetime.now().isoformat()
-        }
+        payload = READ_RECEIPT_TEMPLATE % (orjson.dumps(message_id), json_timestamp())
         
         # Publish to sender's topic
-        topic = f"{MQTT_TOPIC}/{sender_id}"
-        self.client.publish(topic, json.dumps(status_data))
-        print(f"👁️ Sent read receipt for message {message_id[:8]}...")
+        topic = TOPIC_PREFIX + sender_id
+        self.client.publish(topic, payload)
+        logger.info("👁️ Sent read receipt for message %.8s...", message_id)
+
+    def send_read_batch(self, message_ids, sender_id):
+        """Send one read receipt covering several messages from the same sender."""
+        payload = READ_BATCH_TEMPLATE % (orjson.dumps(message_ids), json_timestamp())
+        
+        topic = TOPIC_PREFIX + sender_id
+        self.client.publish(topic, payload)
+        logger.info("👁️ Sent read receipt for %d messages to %s", len(message_ids), sender_id)
+
+    def flush_read_receipts(self):
+        """Send pending read receipts, one publish per sender, and reschedule."""
+        # Reschedule first so a failed publish can't stop future receipts
+        if self.running:
+            self.schedule(READ_RECEIPT_INTERVAL, self.flush_read_receipts)
+        
+        with self._receipts_lock:
+            pending = self._pending_receipts
+            self._pending_receipts = {}
+        
+        for sender_id, message_ids in pending.items():
+            # One sender's failure must not drop the receipts queued for the rest
+            try:
+                # A lone receipt keeps the plain "status" format for older clients
+                if len(message_ids) == 1:
+                    self.send_read_receipt(message_ids[0], sender_id)
+                else:
+                    self.send_read_batch(message_ids, sender_id)
+            except Exception as error:
+                logger.error("🔥 Could not send read receipts to %s: %s", sender_id, error)
 
     def send_message(self, receiver_id, content, message_type="text"):
         """Send a chat message."""
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now().isoformat()
+        message_id = new_message_id()
         
-        message_data = {
-            "type": "message",
-            "message_id": message_id,
-            "sender_id": CHAT_USER_ID,
-            "sender_name": CHAT_USER_NAME,
-            "receiver_id": receiver_id,
-            "content": content,
-            "message_type": message_type,
-            "timestamp": timestamp
-        }
+        # Only the variable fields are encoded; the UUID needs no JSON escaping
+        payload = MESSAGE_TEMPLATE % (
+            message_id.encode(),
+            orjson.dumps(receiver_id),
+            orjson.dumps(content),
+            orjson.dumps(message_type),
+            json_timestamp()
+        )
         
-        # Publish to receiver's topic
-        topic = f"{MQTT_TOPIC}/{receiver_id}"
-        self.client.publish(topic, json.dumps(message_data))
+        # Store in database through the flusher, which owns the insert cursor.
+        # Never block: this thread also drives the MQTT socket and the prompt.
+        # Buffer before publishing so a message is never delivered but not stored.
+        if not self.buffer_rows(
+            msg_row=(message_id, CHAT_USER_ID, CHAT_USER_NAME, receiver_id, content, message_type),
+            status_row=(message_id, "sent", CHAT_USER_ID),
+            block=False,
+        ):
+            print("❌ Message not sent: the database writer is backed up or down. Try again shortly.")
+            return None
         
-        # Also publish to general topic for logging
-        self.client.publish(MQTT_TOPIC, json.dumps(message_data))
+        # Publish to receiver's topic only; a logger can subscribe to f"{MQTT_TOPIC}/#"
+        topic = TOPIC_PREFIX + receiver_id
+        self.client.publish(topic, payload)
         
-        # Store in database
-        with self.db_conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO chat_messages (message_id, sender_id, sender_name, receiver_id, content, message_type)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, [message_id, CHAT_USER_ID, CHAT_USER_NAME, receiver_id, content, message_type])
-            
-            # Add sent status
-            cur.execute("""
-                INSERT INTO message_status (message_id, status, user_id)
-                VALUES (%s, %s, %s)
-            """, [message_id, "sent", CHAT_USER_ID])
-            
-            self.db_conn.commit()
-        
-        print(f"📤 Message sent: {content}")
+        logger.info("📤 Message sent: %s", content)
         return message_id
 
     def send_typing_indicator(self, receiver_id, is_typing=True):
         """Send typing indicator."""
-        typing_data = {
-            "type": "typing",
-            "sender_id": CHAT_USER_ID,
-            "sender_name": CHAT_USER_NAME,
-            "receiver_id": receiver_id,
-            "is_typing": is_typing,
-            "timestamp": datetime.now().isoformat()
-        }
+        payload = TYPING_TEMPLATE % (
+            orjson.dumps(receiver_id),
+            b"true" if is_typing else b"false",
+            json_timestamp()
+        )
         
-        topic = f"{MQTT_TOPIC}/{receiver_id}"
-        self.client.publish(topic, json.dumps(typing_data))
+        topic = TOPIC_PREFIX + receiver_id
+        self.client.publish(topic, payload)
 
     def get_message_history(self, limit=50):
         """Retrieve message history from database."""
-        with self.db_conn.cursor() as cur:
+        with self.db_cursor() as cur:
             cur.execute("""
                 SELECT cm.*, ms.status, ms.timestamp as status_timestamp
                 FROM chat_messages cm
-                LEFT JOIN message_status ms ON cm.message_id = ms.message_id
+                LEFT JOIN LATERAL (
+                    -- Latest status only, read from idx_message_status_message_id_ts
+                    SELECT status, timestamp
+                    FROM message_status
+                    WHERE message_id = cm.message_id
+                    ORDER BY timestamp DESC
+                    LIMIT 1
+                ) ms ON TRUE
                 WHERE cm.sender_id = %s OR cm.receiver_id = %s
                 ORDER BY cm.created_at DESC
                 LIMIT %s
@@ -295,53 +880,125 @@ class ChatSubscriber:
         print("quit                      - Exit chat")
         print("="*50)
 
+    def handle_command(self, user_input):
+        """Run one line typed at the chat prompt."""
+        parts = user_input.split(' ', 2)
+        command = parts[0].lower()
+        
+        if command == "send" and len(parts) >= 3:
+            receiver_id = parts[1]
+            message = parts[2]
+            self.send_message(receiver_id, message)
+            
+        elif command == "broadcast" and len(parts) >= 2:
+            message = parts[1]
+            self.send_message("all", message)
+            
+        elif command == "history":
+            limit = int(parts[1]) if len(parts) > 1 else 10
+            history = self.get_message_history(limit)
+            print(f"\n📚 Last {len(history)} messages:")
+            for msg in reversed(history):
+                print(f"[{msg[8]}] {msg[3]}: {msg[5]}")
+                
+        elif command == "typing" and len(parts) >= 2:
+            receiver_id = parts[1]
+            self.send_typing_indicator(receiver_id, True)
+            self.schedule(3.0, self.send_typing_indicator, (receiver_id, False))
+            
+        elif command == "help":
+            self.display_help()
+            
+        elif command == "quit":
+            self.running = False
+            print("👋 Goodbye!")
+            
+        else:
+            print("❌ Invalid command. Type 'help' for available commands.")
+
+    def service_mqtt(self, sock, readable, writable):
+        """Let paho read, write and send keepalives after select() returns."""
+        if sock is None:
+            # Connection lost; retry periodically on a helper thread, because
+            # reconnect() blocks on DNS and a TCP connect of up to 5 seconds
+            if not self.reconnecting() and time.monotonic() >= self._next_reconnect:
+                self._next_reconnect = time.monotonic() + MQTT_RECONNECT_DELAY
+                self._reconnect_thread = threading.Thread(
+                    target=self.reconnect_mqtt, name="mqtt-reconnect", daemon=True)
+                self._reconnect_thread.start()
+            return
+        
+        if sock in readable:
+            self.client.loop_read()
+        if sock in writable:
+            self.client.loop_write()
+        self.client.loop_misc()
+
+    def reconnecting(self):
+        """Returns True while a reconnect attempt is running."""
+        return self._reconnect_thread is not None and self._reconnect_thread.is_alive()
+
+    def reconnect_mqtt(self):
+        """Reconnect to the broker; runs on a helper thread so the prompt stays responsive."""
+        try:
+            logger.info("⏳ Reconnecting to MQTT Broker...")
+            self.client.reconnect()
+        except OSError as error:
+            logger.error("❌ MQTT reconnect failed: %s", error)
+
     def start_chat_interface(self):
-        """Start the interactive chat interface."""
+        """Start the interactive chat interface.
+
+        The main thread runs one select() loop over stdin and the MQTT socket,
+        so no separate network thread or blocking input() is needed.
+        """
         print(f"\n🎉 Welcome to the chat, {CHAT_USER_NAME}!")
         print(f"Your ID: {CHAT_USER_ID}")
         self.display_help()
+        print(f"\n[{CHAT_USER_NAME}] ", end="", flush=True)
         
         while self.running:
             try:
-                user_input = input(f"\n[{CHAT_USER_NAME}] ").strip()
+                # Leave the socket to the reconnect thread until it finishes
+                sock = None if self.reconnecting() else self.client.socket()
+                readers = [sys.stdin]
+                writers = []
+                if sock is not None:
+                    readers.append(sock)
+                    if self.client.want_write():
+                        writers.append(sock)
                 
-                if not user_input:
+                readable, writable, _ = select.select(readers, writers, [], EVENT_LOOP_TIMEOUT)
+                self.service_mqtt(sock, readable, writable)
+                
+                if sys.stdin not in readable:
                     continue
-                    
-                parts = user_input.split(' ', 2)
-                command = parts[0].lower()
                 
-                if command == "send" and len(parts) >= 3:
-                    receiver_id = parts[1]
-                    message = parts[2]
-                    self.send_message(receiver_id, message)
-                    
-                elif command == "broadcast" and len(parts) >= 2:
-                    message = parts[1]
-                    self.send_message("all", message)
-                    
-                elif command == "history":
-                    limit = int(parts[1]) if len(parts) > 1 else 10
-                    history = self.get_message_history(limit)
-                    print(f"\n📚 Last {len(history)} messages:")
-                    for msg in reversed(history):
-                        print(f"[{msg[8]}] {msg[3]}: {msg[5]}")
-                        
-                elif command == "typing" and len(parts) >= 2:
-                    receiver_id = parts[1]
-                    self.send_typing_indicator(receiver_id, True)
-                    threading.Timer(3.0, self.send_typing_indicator, args=[receiver_id, False]).start()
-                    
-                elif command == "help":
-                    self.display_help()
-                    
-                elif command == "quit":
-                    self.running = False
-                    print("👋 Goodbye!")
-                    break
-                    
+                # Read the raw descriptor: a buffered readline() would pull several
+                # pasted lines into Python's buffer, where select() can't see them
+                data = os.read(sys.stdin.fileno(), STDIN_READ_SIZE)
+                if not data:
+                    # stdin closed; run a final unterminated line before leaving
+                    lines, self._stdin_buf = [self._stdin_buf], b""
                 else:
-                    print("❌ Invalid command. Type 'help' for available commands.")
+                    *lines, self._stdin_buf = (self._stdin_buf + data).split(b"\n")
+                
+                for line in lines:
+                    user_input = line.decode(errors="replace").strip()
+                    if user_input:
+                        # Report per line so one bad command doesn't drop the rest
+                        try:
+                            self.handle_command(user_input)
+                        except Exception as e:
+                            print(f"❌ Error: {e}")
+                    if not self.running:
+                        break
+                
+                if not data and self.running:
+                    self.running = False
+                    print("\n👋 Goodbye!")
+                elif self.running and lines:
+                    print(f"\n[{CHAT_USER_NAME}] ", end="", flush=True)
                     
             except KeyboardInterrupt:
                 self.running = False
@@ -352,36 +1009,59 @@ class ChatSubscriber:
 
     def run(self):
         """Main method to run the chat subscriber."""
-        # 1. Establish database connection
-        self.db_conn = self.get_db_connection()
-        self.setup_database(self.db_conn)
+        log_listener = setup_logging()
+        
+        # 1. Establish database connection pool
+        self.pool = self.get_db_pool()
+        conn = self.pool.getconn()
+        try:
+            self.setup_database(conn)
+        finally:
+            self.pool.putconn(conn)
+        
+        # Background writer for incoming messages and status rows; started
+        # before the workers so it is running whenever they buffer rows
+        self._flush_thread = threading.Thread(target=self.flush_loop, name="db-flusher")
+        self._flush_thread.start()
+        
+        # Workers that process received messages off the MQTT network thread
+        for i, inbox in enumerate(self._inboxes):
+            worker = threading.Thread(target=self.worker_loop, args=(inbox,), name=f"chat-worker-{i}")
+            worker.start()
+            self._workers.append(worker)
+        
+        # Deferred work runs on one daemon thread instead of a Timer per event
+        self._sched_thread = threading.Thread(target=self.scheduler_loop, name="scheduler", daemon=True)
+        self._sched_thread.start()
+        self.schedule(READ_RECEIPT_INTERVAL, self.flush_read_receipts)
 
         # 2. Setup MQTT Client
         self.client = mqtt.Client(client_id=f"chat-subscriber-{CHAT_USER_ID}")
-        self.client.user_data_set({'db_conn': self.db_conn})
+        self.client.user_data_set({'db_pool': self.pool})
 
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
         # 3. Connect to Broker and start the loop
         try:
-            print("⏳ Connecting to MQTT Broker...")
+            logger.info("⏳ Connecting to MQTT Broker...")
             self.client.connect(MQTT_BROKER_HOST, 1883, 60)
             
-            # Start MQTT loop in a separate thread
-            mqtt_thread = threading.Thread(target=self.client.loop_forever)
-            mqtt_thread.daemon = True
-            mqtt_thread.start()
-            
-            # Start chat interface
+            # Start chat interface, which also drives the MQTT network loop
             self.start_chat_interface()
             
         except Exception as e:
-            print(f"🚨 Could not start MQTT client: {e}")
+            logger.error("🚨 Could not start MQTT client: %s", e)
         finally:
-            if self.db_conn:
-                self.db_conn.close()
-                print("🔌 Database connection closed.")
+            # The main loop no longer reads the socket, so nothing new arrives
+            # while the workers drain. Receipts they queue go out before disconnecting.
+            self.stop_workers()
+            self.flush_read_receipts()
+            self.client.disconnect()
+            self.stop_flusher()
+            self.pool.closeall()
+            logger.info("🔌 Database connection closed.")
+            log_listener.stop()
 
 if __name__ == '__main__':
     chat_subscriber = ChatSubscriber()